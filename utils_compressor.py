@@ -1,4 +1,51 @@
-from numpy import sqrt
+from dataclasses import dataclass
+from functools import lru_cache
+
+from numpy import asarray, broadcast_shapes, broadcast_to, empty, float64, ndarray, power
+
+from utils_flow import FlowUtils
+from utils_jit import njit
+
+try:
+    import numexpr
+except ImportError:
+    numexpr = None
+
+RGAS_2 = FlowUtils.rgas_2  # methane gas constant used for compressor head [ft*lbf/(lbm*degR)]
+
+_COMP_HEAD_EXPR = 'z_avg / mratio * t_suction * rgas_2 * (exp(mratio * log(p_discharge / p_suction)) - 1)'
+
+
+@njit(cache=True, fastmath=True)
+def _comp_head_nb(p_s, p_d, z, mr, t):
+    """ compiled kernel for CompressorUtils.comp_head """
+    return z / mr * t * RGAS_2 * ((p_d / p_s) ** mr - 1.0)
+
+
+@njit(cache=True, fastmath=True)
+def _calc_power_nb(eta, mflow, head, meff):
+    """ compiled kernel for CompressorUtils.calc_comp_consumed_power """
+    return mflow * head / (meff * eta * 86400.0 * 550.0)
+
+
+@njit(cache=True, fastmath=True)
+def _comp_head_vec(p_s, p_d, z, mr, t, r):
+    """
+    compressor head for a batch of operating points (1-D arrays of equal length), e.g. a full performance map,
+    evaluated in a single compiled loop.  The result has the dtype of p_s, so float32 inputs give a float32 map
+    """
+    n = p_s.shape[0]
+    out = empty(n, p_s.dtype)
+    for i in range(n):
+        out[i] = z[i] / mr[i] * t[i] * r * ((p_d[i] / p_s[i]) ** mr[i] - 1.0)
+    return out
+
+
+@lru_cache(maxsize=16384)
+def _pow_cached(ratio: float, mratio: float) -> float:
+    """ cache behind CompressorUtils.comp_head_cached, expects already rounded inputs """
+    return ratio ** mratio
+
 
 class CompressorUtils:
     """
@@ -12,8 +59,7 @@ class CompressorUtils:
     """
 
     @staticmethod
-    def comp_head(p_suction: float, p_discharge: float, z_avg: float, mratio: float, t_suction: float,
-                  rgas_2: float = 96.3034) -> float:
+    def comp_head(p_suction: float, p_discharge: float, z_avg: float, mratio: float, t_suction: float) -> float:
         """
         actual/standard compressor head calculation
 
@@ -22,10 +68,48 @@ class CompressorUtils:
         :param z_avg: average comrpessibility                               [1]
         :param mratio: (k-1)/k, where k = specific heat ratio               [1]
         :param t_suction: suction temperature                               [degR]
-        :param rgas_2: Gas constant, default = 1545/16.043                  [ft*lbf/(lbm*degR)]
+        :return: compressor Head, using gas constant RGAS_2                 [ft*lbf/lbm]
+        """
+        return _comp_head_nb(p_suction, p_discharge, z_avg, mratio, t_suction)
+
+    @staticmethod
+    def comp_head_cached(p_suction: float, p_discharge: float, z_avg: float, mratio: float,
+                         t_suction: float) -> float:
+        """
+        comp_head for scalar inputs with the pressure ratio power memoized, for solver iterations that revisit nearly
+        the same pressures.  The pressure ratio and mratio are rounded to 1e-6 before the lookup, which changes the
+        head by well under 0.1% except for pressure ratios within ~0.1% of 1
+
+        :param p_suction: suction pressure                                  [psia]
+        :param p_discharge: discharge pressure                              [psia]
+        :param z_avg: average comrpessibility                               [1]
+        :param mratio: (k-1)/k, where k = specific heat ratio               [1]
+        :param t_suction: suction temperature                               [degR]
+        :return: compressor Head, using gas constant RGAS_2                 [ft*lbf/lbm]
+        """
+        ratio_pow = _pow_cached(round(p_discharge / p_suction, 6), round(mratio, 6))
+        return z_avg / mratio * t_suction * RGAS_2 * (ratio_pow - 1.0)
+
+    @staticmethod
+    def comp_head_batch(p_suction, p_discharge, z_avg, mratio, t_suction, rgas_2: float = RGAS_2):
+        """
+        compressor head for arrays of operating points, same equation as comp_head.  When numexpr is installed the
+        whole expression is evaluated in one multi-threaded pass without numpy temporaries; otherwise plain numpy is
+        used.  Inputs must broadcast against each other
+
+        :param p_suction: suction pressure                                  [psia]
+        :param p_discharge: discharge pressure                              [psia]
+        :param z_avg: average comrpessibility                               [1]
+        :param mratio: (k-1)/k, where k = specific heat ratio               [1]
+        :param t_suction: suction temperature                               [degR]
+        :param rgas_2: Gas constant, default RGAS_2 = 1545/16.043           [ft*lbf/(lbm*degR)]
         :return: compressor Head                                            [ft*lbf/lbm]
         """
-        return z_avg / mratio * t_suction * rgas_2 * ((p_discharge / p_suction) ** mratio - 1)
+        if numexpr is not None:
+            return numexpr.evaluate(_COMP_HEAD_EXPR, local_dict={
+                'p_suction': p_suction, 'p_discharge': p_discharge, 'z_avg': z_avg, 'mratio': mratio,
+                't_suction': t_suction, 'rgas_2': rgas_2})
+        return z_avg / mratio * t_suction * rgas_2 * (power(asarray(p_discharge) / p_suction, mratio) - 1.0)
 
     @staticmethod
     def calc_comp_consumed_power(eta: float, massflow: float, head: float, mech_eff: float = 1) -> float:
@@ -40,4 +124,53 @@ class CompressorUtils:
         :param mech_eff: mechanical train efficiency                        [1]
         :return: power                                                      [horsepower or HP]
         """
-        return 1 / (mech_eff * eta * 86400 * 550) * massflow * head
+        return _calc_power_nb(eta, massflow, head, mech_eff)
+
+
+@dataclass
+class CompressorOperatingPoints:
+    """
+    a batch of compressor operating points stored as one array per quantity, e.g. all points of a performance map.
+    head_vec and power_vec evaluate the CompressorUtils equations over every point at once instead of looping in python
+
+    All fields are converted to arrays of the given dtype (default float64) and must broadcast against each other.
+    """
+    p_suction: ndarray          # suction pressure                  [psia]
+    p_discharge: ndarray        # discharge pressure                [psia]
+    z_avg: ndarray              # average compressibility           [1]
+    mratio: ndarray             # (k-1)/k                           [1]
+    t_suction: ndarray          # suction temperature               [degR]
+    massflow: ndarray           # mass flow through compressor      [lbm/day]
+    eta: ndarray                # compressor efficiency             [1]
+    dtype: type = float64
+
+    def __post_init__(self):
+        for name in ('p_suction', 'p_discharge', 'z_avg', 'mratio', 't_suction', 'massflow', 'eta'):
+            setattr(self, name, asarray(getattr(self, name), dtype=self.dtype))
+
+    def head_vec(self, rgas_2: float = RGAS_2) -> ndarray:
+        """
+        compressor head for every operating point, see CompressorUtils.comp_head.  A 1-D map is evaluated in one
+        compiled loop (_comp_head_vec), other shapes with numpy
+
+        :param rgas_2: Gas constant, default RGAS_2 = 1545/16.043           [ft*lbf/(lbm*degR)]
+        :return: compressor Head                                            [ft*lbf/lbm]
+        """
+        fields = (self.p_suction, self.p_discharge, self.z_avg, self.mratio, self.t_suction)
+        points_shape = broadcast_shapes(*(a.shape for a in fields))
+        p_s, p_d, z, mr, t = (broadcast_to(a, points_shape) for a in fields)
+        if p_s.ndim == 1:
+            return _comp_head_vec(p_s, p_d, z, mr, t, rgas_2)
+        return z / mr * t * rgas_2 * (power(p_d / p_s, mr) - 1.0)
+
+    def power_vec(self, mech_eff: float = 1, head: ndarray = None) -> ndarray:
+        """
+        power consumed at every operating point, see CompressorUtils.calc_comp_consumed_power
+
+        :param mech_eff: mechanical train efficiency                        [1]
+        :param head: compressor head, computed with head_vec if not given   [ft*lbf/lbm]
+        :return: power                                                      [horsepower or HP]
+        """
+        if head is None:
+            head = self.head_vec()
+        return self.massflow * head / (mech_eff * 86400.0 * 550.0 * self.eta)
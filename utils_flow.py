@@ -1,4 +1,26 @@
-from numpy import array
+from functools import lru_cache
+
+from numpy import asarray, broadcast_shapes, divide, empty, float64, may_share_memory, multiply, reciprocal, shape, sqrt
+
+from utils_jit import njit
+
+# CNGA compressibility correlation (GPH eq.1.34): z = 1 / (1 + A1 * (p - P_GAUGE_OFFSET) * 10**(A2 * sg) / T**A3)
+_CNGA_A1 = 344400.0
+_CNGA_A2 = 1.785
+_CNGA_A3 = 3.825
+_P_GAUGE_OFFSET = 14.7                 # [psia] atmospheric pressure used by the correlation for gauge pressure
+
+
+def _batch_out(out, dtype, *args):
+    """
+    return the output buffer for a batched conversion, allocating one of the broadcast shape if not given, together
+    with the inputs.  The conversions write partial products into out before reading all inputs, so any input that
+    shares memory with out is copied first
+    """
+    if out is None:
+        return empty(broadcast_shapes(*(shape(a) for a in args)), dtype=dtype), args
+    return out, tuple(a.copy() if may_share_memory(out, a) else a for a in args)
+
 
 class FlowUtils():
     """
@@ -28,7 +50,7 @@ class FlowUtils():
     **** Note that rgas_2 is the same gas constant but expressed in different physical units
     """
     rgas_1 = 0.66895  # [PSIA*ft^3/(lbm*degR)]
-    rgas_2 = 96.5625  # [ft*lbf/(lbm*degR)]
+    rgas_2 = 96.3034  # [ft*lbf/(lbm*degR)], 1545/16.043, within ~0.03% of rgas_1 * 144 = 96.33
     k_sp_heat_ratio = 1.32
     cmf = tb * rgas_1 / pb
 
@@ -45,9 +67,10 @@ class FlowUtils():
         :param cmf: constant for converting to mass flow (see GPNO ch.2)
         :return: mass_flow                                                  [lbm/day]
         """
-        if abs(cmf) < 1e-8:
-            raise RuntimeWarning('cmf very close to 0, check physical units')
-        return ksuc * p_suction * q_actual * 60 * 24 / cmf
+        if __debug__:
+            if abs(cmf) < 1e-8:
+                raise RuntimeWarning('cmf very close to 0, check physical units')
+        return ksuc * p_suction * q_actual * _MIN_PER_DAY / cmf
 
     @staticmethod
     def convert_qb_to_mass_flow(q_standard: float, rgas_1: float = rgas_1) -> float:
@@ -58,7 +81,7 @@ class FlowUtils():
         :param rgas: specific gas constant                                  [psia*ft^3/(lbm*degR)]
         :return: mass flow                                                  [lbm/day]
         """
-        return q_standard * FlowUtils.pb / (rgas_1 * FlowUtils.tb)
+        return q_standard * _PB_OVER_TB / rgas_1
 
     @staticmethod
     def convert_mass_flow_to_qb(mass_flow: float, rgas_1: float = rgas_1) -> float:
@@ -69,7 +92,7 @@ class FlowUtils():
         :param rgas_1: specific gas constant                                [psia*ft^3/(lbm*degR)]
         :return: q_standard                                                 [scfd] or [ft^3/day] @ standard conditions
         """
-        return mass_flow * (rgas_1 * FlowUtils.tb) / FlowUtils.pb
+        return mass_flow * rgas_1 * _TB_OVER_PB
 
     @staticmethod
     def convert_m_to_qa_acfm(mass_flow: float, ksuc: float, p_suction: float, cmf: float = cmf) -> float:
@@ -84,7 +107,7 @@ class FlowUtils():
         :param cmf: constant for converting to mass flow (see GPNO ch.2)
         :return: q_actual                                                   [acfm] or [ft^3/minute]
         """
-        return mass_flow * cmf / (ksuc * p_suction) / 1440
+        return mass_flow * cmf * _DAY_PER_MIN / (ksuc * p_suction)
 
     @staticmethod
     def convert_qa_to_qb(q_actual: float, t_suction: float, p_suction: float, z_suction: float) -> float:
@@ -100,7 +123,67 @@ class FlowUtils():
         :param z_suction: suction compressibility factor                    [1]
         :return: q_standard                                                 [scfm] or [ft^3/min] @ standard conditions
         """
-        return q_actual * p_suction * FlowUtils.tb / (t_suction * FlowUtils.pb * z_suction)
+        return q_actual * p_suction * _TB_OVER_PB / (t_suction * z_suction)
+
+    @staticmethod
+    def convert_qa_to_mass_flow_batch(q_actual, p_suction, ksuc, cmf: float, out=None, dtype=float64):
+        """
+        batched version of convert_qa_to_mass_flow.  Inputs may be any broadcastable mix of arrays and scalars; the
+        result is written into out, which can be preallocated and reused between solver iterations.  With float32 inputs
+        and out the whole calculation runs in single precision, which is ample given the ~1% accuracy of the gas
+        property correlations
+
+        :param q_actual: volumetric flow                                    [acfm] = [ft^3/m]
+        :param p_suction: suction pressure                                  [psia]
+        :param ksuc: constant for real gas conversion (see convert_qa_to_mass_flow)
+        :param cmf: constant for converting to mass flow (see GPNO ch.2)
+        :param out: optional output array of the broadcast shape.  It may be one of the inputs (e.g. q_actual, to
+            convert in place); such an input is copied before out is overwritten, so the result is still correct
+        :param dtype: dtype of out when it is allocated here, float32 halves memory traffic for large networks
+        :return: mass_flow                                                  [lbm/day]
+        """
+        out, (q_actual, p_suction, ksuc) = _batch_out(out, dtype, q_actual, p_suction, ksuc)
+        multiply(ksuc, p_suction, out=out)
+        multiply(out, q_actual, out=out)
+        return multiply(out, _MIN_PER_DAY / cmf, out=out)
+
+    @staticmethod
+    def convert_m_to_qa_acfm_batch(mass_flow, ksuc, p_suction, cmf: float = cmf, out=None, dtype=float64):
+        """
+        batched version of convert_m_to_qa_acfm, see convert_qa_to_mass_flow_batch for broadcasting and out
+
+        :param mass_flow: mass flow                                         [lbm/day]
+        :param ksuc: constant for real gas conversion (see convert_m_to_qa_acfm)
+        :param p_suction: suction pressure                                  [psia]
+        :param cmf: constant for converting to mass flow (see GPNO ch.2)
+        :param out: optional output array of the broadcast shape
+        :param dtype: dtype of out when it is allocated here
+        :return: q_actual                                                   [acfm] or [ft^3/minute]
+        """
+        out, (mass_flow, ksuc, p_suction) = _batch_out(out, dtype, mass_flow, ksuc, p_suction)
+        multiply(ksuc, p_suction, out=out)
+        divide(mass_flow, out, out=out)
+        return multiply(out, cmf * _DAY_PER_MIN, out=out)
+
+    @staticmethod
+    def convert_qa_to_qb_batch(q_actual, t_suction, p_suction, z_suction, out=None, dtype=float64):
+        """
+        batched version of convert_qa_to_qb, see convert_qa_to_mass_flow_batch for broadcasting and out
+
+        :param q_actual: volumetric flow                                    [acfm] or [ft^3/min]
+        :param t_suction: suction temperature                               [degR]
+        :param p_suction: suction pressure                                  [psia]
+        :param z_suction: suction compressibility factor                    [1]
+        :param out: optional output array of the broadcast shape
+        :param dtype: dtype of out when it is allocated here
+        :return: q_standard                                                 [scfm] or [ft^3/min] @ standard conditions
+        """
+        out, (q_actual, t_suction, p_suction, z_suction) = _batch_out(out, dtype, q_actual, t_suction, p_suction,
+                                                                       z_suction)
+        multiply(t_suction, z_suction, out=out)
+        divide(p_suction, out, out=out)
+        multiply(out, q_actual, out=out)
+        return multiply(out, _TB_OVER_PB, out=out)
 
     @staticmethod
     def calc_pavg(p1: float, p2: float) -> float:
@@ -111,9 +194,10 @@ class FlowUtils():
         :param p2: downstream pressure                  [psia]
         :return: pavg                                   [psia]
         """
-        p1 = array(p1)
-        p2 = array(p2)
-        return (2 / 3) * (p1 + p2 - p1 * p2 / (p1 + p2))
+        p1 = asarray(p1)
+        p2 = asarray(p2)
+        s = p1 + p2
+        return (2 / 3) * (s - p1 * p2 / s)
 
     @staticmethod
     def calc_z_factor_cnga(sg: float, tavg: float, pavg: float) -> float:
@@ -126,15 +210,83 @@ class FlowUtils():
         :param pavg: average pressure                   [psia]
         :return: z (compressibility factor)             [1]
         """
-        pavg_psig = pavg - 14.7  # put pavg into gauge units
-        tavg_abs = array(tavg) + 460  # put temperature into degR
-        term = pavg_psig * 344400 * 10 ** (1.785 * sg) / (tavg_abs ** 3.825)
-        return 1 / (1 + term)
+        pavg_psig = asarray(pavg) - _P_GAUGE_OFFSET  # put pavg into gauge units
+        tavg_abs = asarray(tavg) + 460.0  # put temperature into degR
+        term = pavg_psig * (_CNGA_A1 * 10.0 ** (_CNGA_A2 * sg)) / tavg_abs ** _CNGA_A3  # full broadcast shape
+        term += 1.0
+        return reciprocal(term)
+
+    @staticmethod
+    def calc_z_factor_cnga_cached(sg: float, tavg: float, pavg: float) -> float:
+        """
+        memoized calc_z_factor_cnga for scalar inputs, for sweeps that revisit the same operating points (grid
+        searches, scenario enumeration).  Inputs are rounded to 1e-6 sg, 0.001 degF and 0.001 psia before the lookup;
+        the resulting change in z is below 2e-6 over typical pipeline conditions, far inside the ~1% accuracy of the
+        CNGA correlation itself
+
+        :param sg: specific gravity                     [1]
+        :param tavg: average gas temperature            [degF]
+        :param pavg: average pressure                   [psia]
+        :return: z (compressibility factor)             [1]
+        """
+        return _z_cnga_cached(round(sg, 6), round(tavg, 3), round(pavg, 3))
+
+    @staticmethod
+    def precompute_cnga_coeffs(sg: float, tavg: float) -> tuple:
+        """
+        CNGA coefficients for the linear form z = 1 / (b1 + b2 * pavg).  The CNGA correlation is linear in pressure
+        once sg and tavg are fixed, so for a sweep at constant gas properties and temperature these only need to be
+        computed once and then passed to calc_z_factor_cnga_fast
+
+        :param sg: specific gravity                     [1]
+        :param tavg: average gas temperature            [degF]
+        :return: (b1, b2)                               ([1], [1/psia])
+        """
+        b2 = _CNGA_A1 * 10.0 ** (_CNGA_A2 * sg) / (asarray(tavg) + 460.0) ** _CNGA_A3
+        b1 = 1.0 - _P_GAUGE_OFFSET * b2
+        return b1, b2
+
+    @staticmethod
+    def calc_z_factor_cnga_fast(pavg: float, b1: float, b2: float) -> float:
+        """
+        calculates the CNGA compressibility factor from coefficients given by precompute_cnga_coeffs.  Gives the same
+        result as calc_z_factor_cnga
+
+        :param pavg: average pressure                   [psia]
+        :param b1: CNGA coefficient                     [1]
+        :param b2: CNGA coefficient                     [1/psia]
+        :return: z (compressibility factor)             [1]
+        """
+        return 1.0 / (b1 + b2 * pavg)
+
+    @staticmethod
+    def pressure_from_density(rho: float, tf: float, b1: float, b2: float, rgas_1: float = rgas_1) -> float:
+        """
+        pressure of gas at a given density using the linearized CNGA z factor, z = 1 / (b1 + b2 * p).  Substituting z
+        into p = z * rho * rgas_1 * tf gives a quadratic in p, solved here in closed form instead of iterating
+
+        :param rho: gas density                         [lbm/ft^3]
+        :param tf: gas temperature                      [degR]
+        :param b1: CNGA coefficient, from precompute_cnga_coeffs at the same temperature    [1]
+        :param b2: CNGA coefficient, from precompute_cnga_coeffs at the same temperature    [1/psia]
+        :param rgas_1: specific gas constant            [psia*ft^3/(lbm*degR)]
+        :return: pressure                               [psia]
+        """
+        return _pressure_from_density_nb(rho, tf, b1, b2, rgas_1)
 
     @staticmethod
     def general_flow_eq2_2(p1, p2, d, g, tf, l, z, f):
         """ equation 2.2 in GPH """
-        return 77.54 * (FlowUtils.tb / FlowUtils.pb) * d ** 2.5 * ((p1 ** 2 - p2 ** 2) / (g * tf * l * z * f)) ** 0.5
+        return _general_flow_nb(p1, p2, d, g, tf, l, z, f)
+
+    @staticmethod
+    def segment_flow(p1, p2, d, g, tf, l, z, f) -> tuple:
+        """
+        general_flow_eq2_2 and calc_pavg for the same pipe segment in one call, sharing the p1 + p2 term
+
+        :return: (flow from equation 2.2 in GPH, average pressure [psia])
+        """
+        return _segment_flow_nb(p1, p2, d, g, tf, l, z, f)
 
     @staticmethod
     def _calc_ksuc(tf, z):
@@ -146,7 +298,46 @@ class FlowUtils():
         :return ksuc constant                           [1/PSIA]
         """
 
-        return FlowUtils.tb/(FlowUtils.pb*tf*z)
+        return _TB_OVER_PB/(tf*z)
+
+
+@lru_cache(maxsize=8192)
+def _z_cnga_cached(sg: float, tavg: float, pavg: float) -> float:
+    """ cache behind FlowUtils.calc_z_factor_cnga_cached, expects already rounded inputs """
+    return float(FlowUtils.calc_z_factor_cnga(sg, tavg, pavg))
+
+
+# composite constants, evaluated once at import instead of on every call
+_TB_OVER_PB = FlowUtils.tb / FlowUtils.pb
+_PB_OVER_TB = FlowUtils.pb / FlowUtils.tb
+_MIN_PER_DAY = 60.0 * 24.0
+_DAY_PER_MIN = 1.0 / _MIN_PER_DAY
+_KF_TB_OVER_PB = FlowUtils.kf * _TB_OVER_PB
+
+
+@njit(cache=True, fastmath=True)
+def _general_flow_nb(p1, p2, d, g, tf, l, z, f):
+    """ compiled kernel for FlowUtils.general_flow_eq2_2, d**2.5 and **0.5 rewritten with sqrt """
+    return _KF_TB_OVER_PB * d * d * sqrt(d) * sqrt((p1 - p2) * (p1 + p2) / (g * tf * l * z * f))
+
+
+@njit(cache=True, fastmath=True)
+def _segment_flow_nb(p1, p2, d, g, tf, l, z, f):
+    """ compiled kernel for FlowUtils.segment_flow, p1 + p2 is shared by the flow equation and the average pressure """
+    s = p1 + p2
+    pavg = (2.0 / 3.0) * (s - p1 * p2 / s)
+    q = _KF_TB_OVER_PB * d * d * sqrt(d) * sqrt((p1 - p2) * s / (g * tf * l * z * f))
+    return q, pavg
+
+
+@njit(cache=True, fastmath=True)
+def _pressure_from_density_nb(rho, tf, b1, b2, rgas_1):
+    """
+    compiled kernel for FlowUtils.pressure_from_density, positive root of b2*p**2 + b1*p - rho*rgas_1*tf = 0 written
+    as 2c / (b1 + sqrt(b1**2 + 4*b2*c)) to avoid cancellation when b2 is small
+    """
+    c = rho * rgas_1 * tf
+    return 2.0 * c / (b1 + sqrt(b1 * b1 + 4.0 * b2 * c))
 
 
 class FlowUtilsSpecific(FlowUtils):
@@ -161,21 +352,49 @@ class FlowUtilsSpecific(FlowUtils):
         self.sg = sg
         self.k_sp_heat_ratio = k_sp_heat_ratio
         self.cmf = self._calc_cmf()
+        self._qb2m = _PB_OVER_TB / self.rgas_1
+        self._m2qb = self.rgas_1 * _TB_OVER_PB
+        self._cnga_sg_term = _CNGA_A1 * 10.0 ** (_CNGA_A2 * sg)
 
 
     def _calc_cmf(self):
         """ calculate cmf constant based on specified rgas_1 """
-        return FlowUtils.tb * self.rgas_1 / FlowUtils.pb
+        cmf = self.rgas_1 * _TB_OVER_PB
+        if abs(cmf) < 1e-8:
+            raise ValueError('cmf very close to 0, check physical units')
+        return cmf
+
+    def z_cnga(self, pavg: float, tavg: float) -> float:
+        """
+        CNGA compressibility factor for this instance's sg, same as calc_z_factor_cnga but with the sg term computed
+        once at construction.  For repeated calls at one temperature, precompute_cnga_coeffs with
+        calc_z_factor_cnga_fast avoids the temperature power as well
+
+        :param pavg: average pressure                   [psia]
+        :param tavg: average gas temperature            [degF]
+        :return: z (compressibility factor)             [1]
+        """
+        term = (pavg - _P_GAUGE_OFFSET) * self._cnga_sg_term / (tavg + 460.0) ** _CNGA_A3
+        return 1.0 / (1.0 + term)
 
     def convert_qa_to_mass_flow(self, q_actual: float, p_suction: float, ksuc: float) -> float:
-        return super().convert_qa_to_mass_flow(q_actual, p_suction, ksuc, self.cmf)
+        return ksuc * p_suction * q_actual * _MIN_PER_DAY / self.cmf
 
     def convert_qb_to_mass_flow(self, q_standard: float, rgas=None) -> float:
-        return super().convert_qb_to_mass_flow(q_standard, self.rgas_1)
+        return q_standard * self._qb2m
 
     def convert_mass_flow_to_qb(self, mass_flow: float, rgas=None) -> float:
-        return super().convert_mass_flow_to_qb(mass_flow, self.rgas_1)
+        return mass_flow * self._m2qb
 
     def convert_m_to_qa_acfm(self, mass_flow: float, ksuc: float, p_suction: float) -> float:
-        return super().convert_m_to_qa_acfm(mass_flow, ksuc, p_suction, self.cmf)
+        return FlowUtils.convert_m_to_qa_acfm(mass_flow, ksuc, p_suction, self.cmf)
+
+    def pressure_from_density(self, rho: float, tf: float, b1: float, b2: float, rgas_1=None) -> float:
+        return FlowUtils.pressure_from_density(rho, tf, b1, b2, self.rgas_1)
+
+    def convert_qa_to_mass_flow_batch(self, q_actual, p_suction, ksuc, out=None, dtype=float64):
+        return FlowUtils.convert_qa_to_mass_flow_batch(q_actual, p_suction, ksuc, self.cmf, out, dtype)
+
+    def convert_m_to_qa_acfm_batch(self, mass_flow, ksuc, p_suction, out=None, dtype=float64):
+        return FlowUtils.convert_m_to_qa_acfm_batch(mass_flow, ksuc, p_suction, self.cmf, out, dtype)
 
@@ -0,0 +1,23 @@
+"""
+Optional numba support for the calculation modules.
+
+numba is not a hard requirement of the course material.  When it is installed, functions decorated with njit below
+are compiled to native code; otherwise the decorator returns the plain python function and prange falls back to range,
+so results are identical either way.
+"""
+
+try:
+    from numba import njit, prange
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+    prange = range
+
+    def njit(*args, **kwargs):
+        """ no-op stand-in for numba.njit, supports both @njit and @njit(...) usage """
+        if len(args) == 1 and callable(args[0]) and not kwargs:
+            return args[0]
+
+        def decorator(func):
+            return func
+        return decorator
@@ -0,0 +1,89 @@
+"""
+Fused numerical kernels for pipe flow iterations.
+
+A pipeflow iteration in FlowUtils takes several python calls per segment (average pressure, z factor, ksuc, flow
+conversion, flow equation).  The functions here perform the same calculation for a segment in one compiled call, and
+over a whole network with one call parallelised across segments.  Results match the FlowUtils functions; see utils_flow
+for the individual equations and references.
+"""
+
+from math import copysign, sqrt
+
+from numpy import empty
+
+from utils_flow import (FlowUtils, _CNGA_A1, _CNGA_A2, _CNGA_A3, _KF_TB_OVER_PB, _MIN_PER_DAY, _PB_OVER_TB,
+                        _P_GAUGE_OFFSET, _TB_OVER_PB)
+from utils_jit import njit, prange
+
+_M_AIR = FlowUtils.m_air
+_R_UNIVERSAL = FlowUtils.r_universal
+
+
+@njit(cache=True, fastmath=True)
+def _gas_terms(sg: float) -> tuple:
+    """ terms that depend only on the gas: (CNGA sg term A1 * 10**(A2 * sg), rgas_1, cmf) """
+    rgas_1 = _R_UNIVERSAL / (sg * _M_AIR)
+    return _CNGA_A1 * 10.0 ** (_CNGA_A2 * sg), rgas_1, rgas_1 * _TB_OVER_PB
+
+
+@njit(cache=True, fastmath=True)
+def _segment_step(p1, p2, d, sg, tf, l, f, qa, cnga_sg, rgas_1, cmf):
+    """ pipeflow_step with the gas terms from _gas_terms passed in """
+    # average pressure and linearized CNGA z factor, at the upstream end (for converting qa) and at pavg (for the
+    # flow equation)
+    s = p1 + p2
+    pavg = (2.0 / 3.0) * (s - p1 * p2 / s)
+    b2 = cnga_sg / tf ** _CNGA_A3
+    b1 = 1.0 - _P_GAUGE_OFFSET * b2
+    z1 = 1.0 / (b1 + b2 * p1)
+    z = 1.0 / (b1 + b2 * pavg)
+
+    ksuc = _TB_OVER_PB / (tf * z1)
+    mass_flow = ksuc * p1 * qa * _MIN_PER_DAY / cmf
+    dp = p1 - p2
+    q_standard = copysign(_KF_TB_OVER_PB * d * d * sqrt(d) * sqrt(abs(dp) * s / (sg * tf * l * z * f)), dp)
+    return mass_flow, q_standard * _PB_OVER_TB / rgas_1 - mass_flow
+
+
+@njit(cache=True, fastmath=True)
+def pipeflow_step(p1: float, p2: float, d: float, sg: float, tf: float, l: float, f: float, qa: float) -> tuple:
+    """
+    mass flow entering a pipe segment and the mismatch against the general flow equation (GPH eq. 2.2)
+
+    :param p1: upstream pressure                                        [psia]
+    :param p2: downstream pressure                                      [psia]
+    :param d: pipe inside diameter                                      [in]
+    :param sg: gas specific gravity                                     [1]
+    :param tf: gas flowing temperature                                  [degR]
+    :param l: pipe segment length                                       [mi]
+    :param f: friction factor                                           [1]
+    :param qa: actual volumetric flow at upstream conditions            [acfm]
+    :return: (mass_flow, residual), both                                [lbm/day]
+        residual = flow equation mass flow - mass_flow.  The flow equation term takes the sign of p1 - p2, so reverse
+        flow (p2 > p1) gives a negative flow instead of a square root of a negative number
+    """
+    cnga_sg, rgas_1, cmf = _gas_terms(sg)
+    return _segment_step(p1, p2, d, sg, tf, l, f, qa, cnga_sg, rgas_1, cmf)
+
+
+@njit(cache=True, fastmath=True, parallel=True)
+def pipeflow_step_batch(p1, p2, d, sg: float, tf, l, f, qa) -> tuple:
+    """
+    pipeflow_step over all segments of a network, parallel over segments when numba is available
+
+    :param p1, p2, d, tf, l, f, qa: 1-D arrays of equal length, see pipeflow_step for units
+    :param sg: gas specific gravity, shared by all segments             [1]
+    :return: (mass_flow, residual) arrays, same dtype as p1             [lbm/day]
+    """
+    n = p1.shape[0]
+    # numba does not bounds check, so a shorter input would be read past its end
+    if (p2.shape[0] != n or d.shape[0] != n or tf.shape[0] != n or l.shape[0] != n or f.shape[0] != n
+            or qa.shape[0] != n):
+        raise ValueError('p1, p2, d, tf, l, f and qa must all have the same length')
+    cnga_sg, rgas_1, cmf = _gas_terms(sg)
+    mass_flow = empty(n, p1.dtype)
+    residual = empty(n, p1.dtype)
+    for i in prange(n):
+        mass_flow[i], residual[i] = _segment_step(p1[i], p2[i], d[i], sg, tf[i], l[i], f[i], qa[i],
+                                                  cnga_sg, rgas_1, cmf)
+    return mass_flow, residual
@@ -0,0 +1,76 @@
+# cython: language_level=3, boundscheck=False, wraparound=False, cdivision=True
+# distutils: extra_compile_args = -O3 -ffast-math -march=native
+# distutils: libraries = m
+"""
+Optional compiled (Cython) versions of the scalar equations in utils_compressor and utils_flow.
+
+These take and return C doubles only, with no python objects involved, and release the GIL.  The *_array functions
+loop over contiguous float64 arrays, which the C compiler can auto-vectorize.  Build in place with
+
+    cythonize -i utils_native.pyx
+
+This is not needed for the course notebooks; CompressorUtils and FlowUtils remain the reference implementations and
+accept scalars as well as numpy arrays.
+"""
+
+from libc.math cimport pow, sqrt
+
+from utils_flow import _CNGA_A1, _CNGA_A2, _CNGA_A3, _P_GAUGE_OFFSET
+
+cdef double _TB_OVER_PB = 520.0 / 14.696
+cdef double _KF = 77.54
+cdef double _RGAS_2 = 96.3034
+cdef double _A1 = _CNGA_A1
+cdef double _A2 = _CNGA_A2
+cdef double _A3 = _CNGA_A3
+cdef double _P_GAUGE = _P_GAUGE_OFFSET
+
+
+cpdef double comp_head(double p_suction, double p_discharge, double z_avg, double mratio,
+                       double t_suction) noexcept nogil:
+    """ see CompressorUtils.comp_head """
+    return z_avg / mratio * t_suction * _RGAS_2 * (pow(p_discharge / p_suction, mratio) - 1.0)
+
+
+cpdef double calc_comp_consumed_power(double eta, double massflow, double head, double mech_eff=1.0) noexcept nogil:
+    """ see CompressorUtils.calc_comp_consumed_power """
+    return massflow * head / (mech_eff * eta * 86400.0 * 550.0)
+
+
+cpdef double z_cnga(double sg, double tavg, double pavg) noexcept nogil:
+    """ see FlowUtils.calc_z_factor_cnga, tavg in [degF] and pavg in [psia] """
+    return 1.0 / (1.0 + (pavg - _P_GAUGE) * _A1 * pow(10.0, _A2 * sg) / pow(tavg + 460.0, _A3))
+
+
+cpdef double general_flow_eq2_2(double p1, double p2, double d, double g, double tf, double l, double z,
+                                double f) noexcept nogil:
+    """ see FlowUtils.general_flow_eq2_2 """
+    return _KF * _TB_OVER_PB * d * d * sqrt(d) * sqrt((p1 - p2) * (p1 + p2) / (g * tf * l * z * f))
+
+
+cdef _check_lengths(Py_ssize_t n, tuple arrays):
+    """ bounds checking is off in the array loops, so every input must have the length of out """
+    for a in arrays:
+        if a.shape[0] != n:
+            raise ValueError('input arrays must all have the same length as out')
+
+
+def comp_head_array(const double[::1] p_suction, const double[::1] p_discharge, const double[::1] z_avg,
+                    const double[::1] mratio, const double[::1] t_suction, double[::1] out, double rgas_2=_RGAS_2):
+    """ comp_head over equal-length float64 arrays, written into out """
+    cdef Py_ssize_t i, n = out.shape[0]
+    _check_lengths(n, (p_suction, p_discharge, z_avg, mratio, t_suction))
+    with nogil:
+        for i in range(n):
+            out[i] = z_avg[i] / mratio[i] * t_suction[i] * rgas_2 * (pow(p_discharge[i] / p_suction[i], mratio[i]) - 1.0)
+
+
+def calc_comp_consumed_power_array(const double[::1] eta, const double[::1] massflow, const double[::1] head,
+                                   double[::1] out, double mech_eff=1.0):
+    """ calc_comp_consumed_power over equal-length float64 arrays, written into out """
+    cdef Py_ssize_t i, n = out.shape[0]
+    _check_lengths(n, (eta, massflow, head))
+    cdef double c = 1.0 / (mech_eff * 86400.0 * 550.0)
+    with nogil:
+        for i in range(n):
+            out[i] = c * massflow[i] * head[i] / eta[i]